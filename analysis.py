@@ -0,0 +1,264 @@
+"""
+Bulk analysis of archived Yote games.
+
+The games are read as line-delimited JSON, one game per line, with the moves in the format of engine_service.py:
+    {"id": "game-1", "moves": [[[2, 3], "h"], [[1, 3], "h"], ...]}
+Every position of every game is replayed through Yote.play_move and searched in a pool of worker processes.
+One line is written per position, with the evaluation, the best move and the loss of the played move against it:
+    {"game": "game-1", "ply": 0, "turn": 1, "played": [[2, 3], "h"], "best": [[2, 2], "h"], "value": 5.8, "played_value": 5.65, "loss": 0.15}
+The values follow the convention of AI.choose_best_move (the white player maximizes), and the loss is seen from the player who moved.
+With a time limit, the played move is evaluated one ply below the depth actually completed by the search of the position,
+so that both values come from searches of the same depth. That depth is written as "depth".
+A game that can not be read or replayed is reported by a line with an "error".
+
+Identical positions met in several games, reached through the same positions since the last placement or capture, are searched once.
+The games are analysed by chunks, and a checkpoint is written after each chunk, so that an interrupted run resumes where it stopped:
+    python analysis.py games.jsonl --output analysis.jsonl --depth 3 --workers 8
+"""
+import argparse
+import copy
+import json
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from experiments import Yote, AI
+from engine_service import move_to_json, find_move
+
+
+# the AI of this worker process, kept between the positions it searches
+_ai = None
+
+
+def _worker_ai():
+    global _ai
+    if _ai is None:
+        _ai = AI(1)
+    return _ai
+
+
+def _search(game: Yote, depth: int, time_limit: float):
+    """
+    Runs in a worker process: returns the best move of a position, its value and the depth completed by the search
+    """
+    ai = _worker_ai()
+    move, value = ai.choose_best_move(game, depth, game.nplayer == 1, time_limit=time_limit)
+    return move_to_json(move), float(value), ai.depth
+
+
+def _evaluate(game: Yote, depth: int):
+    """
+    Runs in a worker process: returns the value of a position, searched at depth without time limit
+    """
+    return float(_worker_ai().evaluate(game, depth, game.nplayer == 1))
+
+
+def position_key(game: Yote, depth: int):
+    """
+    Identifies a position searched at a depth, so that identical positions of different games are searched once.
+    The positions since the last placement or capture are part of the key, since the search scores their repetitions as draws
+    and their number decides the draw by the move limit.
+    """
+    return game.reversible_positions, game.in_hand_white_stones, game.in_hand_black_stones, game.white_captures, game.black_captures, depth
+
+
+class ResultCache:
+    """
+    The results of the searched positions, the least recently used ones being dropped when the cache is full
+    """
+    def __init__(self, max_entries: int):
+        self.__entries = OrderedDict()
+        self.__max_entries = max_entries
+
+
+    def __contains__(self, key):
+        return key in self.__entries
+
+
+    def get(self, key):
+        self.__entries.move_to_end(key)
+        return self.__entries[key]
+
+
+    def put(self, key, value):
+        self.__entries[key] = value
+        self.__entries.move_to_end(key)
+        if len(self.__entries) > self.__max_entries:
+            self.__entries.popitem(last=False)
+
+
+class Analyzer:
+    def __init__(self, depth: int, time_limit: float, workers: int, cache_size: int):
+        self.__depth = depth
+        self.__time_limit = time_limit
+        self.__pool = ProcessPoolExecutor(max_workers=workers)
+        self.__cache = ResultCache(cache_size)
+
+
+    def __replay(self, record: dict):
+        """
+        Replays a game and returns its positions as (ply, game before the move, played move, game after the move),
+        stopping at the first illegal move, which is returned as the error of the game
+        """
+        if isinstance(record, ValueError):
+            return [], str(record)
+        if not isinstance(record, dict) or not isinstance(record.get('moves', []), list):
+            return [], "invalid game record"
+        game = Yote()
+        positions = []
+        for ply, move in enumerate(record.get('moves', [])):
+            try:
+                possible_move = find_move(game, move)
+            except ValueError:
+                possible_move = None
+            if possible_move is None:
+                return positions, f"illegal move {move!r} at ply {ply}"
+            before = copy.deepcopy(game)
+            game.play_move(possible_move)
+            positions.append((ply, before, possible_move, copy.deepcopy(game)))
+        return positions, None
+
+
+    def __request(self, results: dict, pending: dict, key, function, *args):
+        if key in results or key in pending:
+            return
+        if key in self.__cache:
+            results[key] = self.__cache.get(key)
+        else:
+            pending[key] = self.__pool.submit(function, *args)
+
+
+    def __collect(self, results: dict, pending: dict):
+        for key, future in pending.items():
+            results[key] = future.result()
+            self.__cache.put(key, results[key])
+
+
+    def analyse_chunk(self, records: list):
+        """
+        Analyses a chunk of games and returns the lines to write for them
+        """
+        replays = [self.__replay(record) for record in records]
+
+        # the positions of the whole chunk are sent to the pool at once, each distinct position only once:
+        # first the positions before the moves, then the positions after the moves at the depth completed before them
+        searches = {}
+        pending = {}
+        for positions, _ in replays:
+            for ply, before, move, after in positions:
+                self.__request(searches, pending, ('search', position_key(before, self.__depth)), _search, before, self.__depth, self.__time_limit)
+        self.__collect(searches, pending)
+
+        evaluations = {}
+        pending = {}
+        for positions, _ in replays:
+            for ply, before, move, after in positions:
+                best_move, value, depth = searches['search', position_key(before, self.__depth)]
+                if move_to_json(move) != best_move:
+                    self.__request(evaluations, pending, ('evaluate', position_key(after, depth - 1)), _evaluate, after, depth - 1)
+        self.__collect(evaluations, pending)
+
+        lines = []
+        for record, (positions, error) in zip(records, replays):
+            game_id = record.get('id') if isinstance(record, dict) else None
+            for ply, before, move, after in positions:
+                best_move, value, depth = searches['search', position_key(before, self.__depth)]
+                if move_to_json(move) == best_move:
+                    # the played move is the best one; its value is the value of the position
+                    played_value = value
+                else:
+                    played_value = evaluations['evaluate', position_key(after, depth - 1)]
+                loss = value - played_value if before.nplayer == 1 else played_value - value
+                lines.append({
+                    'game': game_id,
+                    'ply': ply,
+                    'turn': before.nplayer,
+                    'depth': depth,
+                    'played': move_to_json(move),
+                    'best': best_move,
+                    'value': value,
+                    'played_value': played_value,
+                    'loss': loss,
+                })
+            if error is not None:
+                lines.append({'game': game_id, 'error': error})
+        return lines
+
+
+    def shutdown(self):
+        self.__pool.shutdown()
+
+
+def _read_checkpoint(path: str):
+    if not os.path.exists(path):
+        return 0, 0
+    with open(path) as file:
+        checkpoint = json.load(file)
+    return checkpoint['games'], checkpoint['output_bytes']
+
+
+def _write_checkpoint(path: str, games: int, output_bytes: int):
+    # the checkpoint is replaced atomically, so that it is never read half written
+    with open(path + '.tmp', 'w') as file:
+        json.dump({'games': games, 'output_bytes': output_bytes}, file)
+    os.replace(path + '.tmp', path)
+
+
+def _chunks(path: str, skip: int, size: int):
+    """
+    Reads the games of a file lazily by chunks, skipping the games already analysed.
+    A line that is not valid JSON is kept in the chunk as a ValueError, to be reported with the other games.
+    """
+    chunk = []
+    with open(path) as file:
+        index = 0
+        for line in file:
+            if not line.strip():
+                continue
+            index += 1
+            if index <= skip:
+                continue
+            try:
+                chunk.append(json.loads(line))
+            except json.JSONDecodeError as error:
+                chunk.append(ValueError(f"invalid JSON in game {index}: {error}"))
+            if len(chunk) == size:
+                yield chunk
+                chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+
+def run(args: argparse.Namespace):
+    checkpoint = args.checkpoint or args.output + '.checkpoint'
+    games_done, output_bytes = _read_checkpoint(checkpoint)
+
+    analyzer = Analyzer(args.depth, args.time_limit, args.workers, args.cache_size)
+    mode = 'r+' if games_done > 0 and os.path.exists(args.output) else 'w'
+    try:
+        with open(args.output, mode) as output:
+            # the lines written after the last checkpoint belong to an unfinished chunk, which is analysed again
+            output.seek(output_bytes)
+            output.truncate()
+            for chunk in _chunks(args.games, games_done, args.chunk_size):
+                for line in analyzer.analyse_chunk(chunk):
+                    output.write(json.dumps(line) + '\n')
+                output.flush()
+                os.fsync(output.fileno())
+                games_done += len(chunk)
+                _write_checkpoint(checkpoint, games_done, output.tell())
+                print(f"{games_done} games analysed", flush=True)
+    finally:
+        analyzer.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Annotates archived Yote games with engine evaluations")
+    parser.add_argument('games', help="line-delimited JSON file of games")
+    parser.add_argument('--output', required=True, help="line-delimited JSON file of the analysed positions")
+    parser.add_argument('--checkpoint', help="checkpoint file (default: the output file with .checkpoint appended)")
+    parser.add_argument('--depth', type=int, default=3, help="search depth of every position")
+    parser.add_argument('--time-limit', type=float, default=None, help="search time limit of every position, in seconds")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument('--chunk-size', type=int, default=64, help="number of games analysed between two checkpoints")
+    parser.add_argument('--cache-size', type=int, default=1000000, help="number of searched positions remembered to skip duplicates")
+    run(parser.parse_args())
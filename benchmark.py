@@ -0,0 +1,320 @@
+"""
+A reproducible benchmark of the Yote engine over a fixed set of positions.
+
+The positions are reached by random play with fixed seeds: an opening, a midgame with many captures and a sparse endgame.
+For each position the benchmark measures the time and the nodes of the AI search at every depth, the throughput of
+Yote.possible_moves() and Yote.scoring(), and the peak memory allocated by a search.
+
+    python benchmark.py --output results.json
+    python benchmark.py --baseline results.json --threshold 0.1
+
+With a baseline, the results are compared metric by metric and the exit status is 1 when one of them regressed by more than the threshold.
+The deterministic metrics (the nodes and the memory of the searches) are gated with the threshold, and the timings, which vary
+between runs of the same code, with the looser --timing-threshold. The positions are measured in several rounds and every timing
+is the median of its measures, which is compared at the speed the machine had when the baseline was measured: that speed is sampled
+between the measures with a fixed reference workload. Searches shorter than 10 ms are never gated on their timings.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+from experiments import Yote, AI
+
+
+def _opening(game: Yote):
+    return game.history_length > 6
+
+
+def _midgame(game: Yote):
+    return game.white_captures + game.black_captures >= 6 and game.in_hand_white_stones + game.in_hand_black_stones > 0
+
+
+def _endgame(game: Yote):
+    stones_on_board = np.count_nonzero(game.board)
+    return game.in_hand_white_stones == 0 and game.in_hand_black_stones == 0 and 4 <= stones_on_board <= 8
+
+
+# the benchmark positions: name, seed of the random play and the condition at which the play stops
+POSITIONS = [
+    ('opening', 1, _opening),
+    ('midgame', 2, _midgame),
+    ('endgame', 3, _endgame),
+]
+
+# the metrics compared with a baseline: whether a higher value is better, and whether the metric is a timing
+METRICS = {
+    'seconds': (False, True),
+    'nodes': (False, False),
+    'nodes_per_second': (True, True),
+    'possible_moves_per_second': (True, True),
+    'scoring_per_second': (True, True),
+    'peak_memory_bytes': (False, False),
+}
+
+# the searches faster than this (in seconds) are too short for their timings to be compared
+MIN_TIMED_SECONDS = 0.01
+
+# the number of samples of each throughput measure, the median being kept
+THROUGHPUT_SAMPLES = 5
+
+# the duration (in seconds) of each sample of the speed of the machine
+REFERENCE_SECONDS = 0.01
+
+# the data of the reference workload, which measures the speed of the machine
+_REFERENCE_LIST = random.Random(0).sample(range(1000), 300)
+_REFERENCE_ARRAY = np.arange(49).reshape(7, 7)
+
+
+def make_position(seed: int, reached):
+    """
+    Plays random moves from the start of the game until the condition reached is met.
+    A game that ends before is dropped and the next seed is used, so the position only depends on the seed.
+    """
+    while True:
+        rng = random.Random(seed)
+        game = Yote()
+        while not game.is_over()[0]:
+            if reached(game):
+                return game
+            possible_moves = game.possible_moves()
+            game.play_move(possible_moves[rng.randrange(len(possible_moves))])
+        seed += 1000
+
+
+def fingerprint(game: Yote):
+    """
+    Identifies a position, so that results measured on different positions are not compared
+    """
+    return f"{game.position_hash:016x}-{game.in_hand_white_stones}-{game.in_hand_black_stones}-{game.white_captures}-{game.black_captures}"
+
+
+def _reference_work():
+    """
+    A fixed workload of the kind of the engine (lists, dicts and small NumPy arrays), unchanged between revisions
+    """
+    sorted(_REFERENCE_LIST)
+    (_REFERENCE_ARRAY > 24).sum()
+    {value: value for value in _REFERENCE_LIST[:40]}
+
+
+def _rate(function, seconds: float):
+    """
+    Returns the number of calls of function per second, measured during seconds
+    """
+    calls = 0
+    start = time.perf_counter()
+    elapsed = 0
+    while elapsed < seconds:
+        for _ in range(20):
+            function()
+        calls += 20
+        elapsed = time.perf_counter() - start
+    return calls / elapsed
+
+
+def _throughput(function, min_seconds: float, references: list):
+    """
+    Returns the number of calls of function per second, as the median of THROUGHPUT_SAMPLES samples sharing min_seconds.
+    The speed of the machine is sampled after each sample and appended to references.
+    """
+    rates = []
+    for _ in range(THROUGHPUT_SAMPLES):
+        rates.append(_rate(function, min_seconds / THROUGHPUT_SAMPLES))
+        references.append(_rate(_reference_work, REFERENCE_SECONDS))
+    return statistics.median(rates)
+
+
+def benchmark_position(game: Yote, depth: int, min_seconds: float):
+    """
+    Measures the time and the nodes of the searches of a position and the throughput of Yote.possible_moves() and Yote.scoring(),
+    along with the speed of the machine, sampled in between as the median rate of the reference workload
+    """
+    max_player = game.nplayer == 1
+    searches = []
+    references = []
+    for search_depth in range(1, depth + 1):
+        references.append(_rate(_reference_work, REFERENCE_SECONDS))
+        ai = AI(game.nplayer)
+        start = time.perf_counter()
+        ai.choose_best_move(game, search_depth, max_player)
+        seconds = time.perf_counter() - start
+        searches.append({
+            'depth': search_depth,
+            'seconds': seconds,
+            'nodes': ai.nodes,
+            'nodes_per_second': ai.nodes / seconds,
+        })
+    return {
+        'searches': searches,
+        'possible_moves_per_second': _throughput(game.possible_moves, min_seconds, references),
+        'scoring_per_second': _throughput(game.scoring, min_seconds, references),
+        'reference_per_second': statistics.median(references),
+    }
+
+
+def peak_memory(game: Yote, depth: int):
+    """
+    Returns the peak memory allocated by a search, measured apart since tracing the allocations slows the search down
+    """
+    tracemalloc.start()
+    AI(game.nplayer).choose_best_move(game, depth, game.nplayer == 1)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def _median_measures(rounds: list):
+    """
+    Returns the median of the measures of a position over the rounds
+    """
+    searches = []
+    for index, search in enumerate(rounds[0]['searches']):
+        seconds = statistics.median(measures['searches'][index]['seconds'] for measures in rounds)
+        searches.append({
+            'depth': search['depth'],
+            'seconds': seconds,
+            'nodes': search['nodes'],
+            'nodes_per_second': search['nodes'] / seconds,
+        })
+    medians = {'searches': searches}
+    for metric in ('possible_moves_per_second', 'scoring_per_second', 'reference_per_second'):
+        medians[metric] = statistics.median(measures[metric] for measures in rounds)
+    return medians
+
+
+def _revision():
+    try:
+        directory = os.path.dirname(os.path.abspath(__file__))
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=directory, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(depth: int, repeat: int, min_seconds: float):
+    results = {
+        'meta': {
+            'revision': _revision(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'depth': depth,
+            'repeat': repeat,
+        },
+        'positions': {},
+    }
+    games = {name: make_position(seed, reached) for name, seed, reached in POSITIONS}
+
+    # the positions are measured in repeat rounds and the median measures are kept, so that a period when the machine is slower
+    # only spoils the measures of one round instead of all the measures of a position
+    rounds = {name: [] for name in games}
+    for _ in range(repeat):
+        for name, game in games.items():
+            rounds[name].append(benchmark_position(game, depth, min_seconds / repeat))
+
+    for name, game in games.items():
+        results['positions'][name] = {
+            'fingerprint': fingerprint(game),
+            **_median_measures(rounds[name]),
+            'peak_memory_bytes': peak_memory(game, depth),
+        }
+    return results
+
+
+def _metrics(position: dict):
+    """
+    Flattens the metrics of a position into a dict of name -> value, leaving out the timings of the searches that are too short
+    """
+    metrics = {}
+    for search in position['searches']:
+        for metric in ('seconds', 'nodes', 'nodes_per_second'):
+            if METRICS[metric][1] and search['seconds'] < MIN_TIMED_SECONDS:
+                continue
+            metrics[f"depth {search['depth']} {metric}"] = (metric, search[metric])
+    for metric in ('possible_moves_per_second', 'scoring_per_second', 'peak_memory_bytes'):
+        metrics[metric] = (metric, position[metric])
+    return metrics
+
+
+def compare(results: dict, baseline: dict, threshold: float, timing_threshold: float = 0.25):
+    """
+    Compares results with a baseline and returns the list of regressions (as readable lines) and the report of all the metrics.
+    The timings are gated with timing_threshold, which is looser than the threshold of the deterministic metrics,
+    once brought to the speed the machine had when the baseline was measured.
+    """
+    regressions = []
+    report = []
+    for name, position in results['positions'].items():
+        base_position = baseline['positions'].get(name)
+        if base_position is None:
+            report.append(f"{name}: not in the baseline")
+            continue
+        if base_position['fingerprint'] != position['fingerprint']:
+            regressions.append(f"{name}: the position differs from the baseline ({position['fingerprint']} != {base_position['fingerprint']})")
+            continue
+
+        # how much faster the machine was when the baseline was measured (the baselines without a reference are taken as is)
+        speed = 1
+        if base_position.get('reference_per_second') and position.get('reference_per_second'):
+            speed = base_position['reference_per_second'] / position['reference_per_second']
+
+        base_metrics = _metrics(base_position)
+        for label, (metric, value) in _metrics(position).items():
+            if label not in base_metrics:
+                continue
+            base_value = base_metrics[label][1]
+            if not base_value:
+                continue
+            change = (value - base_value) / base_value
+            higher_is_better, timing = METRICS[metric]
+            line = f"{name}: {label} {base_value:.6g} -> {value:.6g} ({change:+.1%})"
+            if timing:
+                value = value * speed if higher_is_better else value / speed
+                change = (value - base_value) / base_value
+                line += f" ({change:+.1%} at the speed of the baseline)"
+            # a positive loss is a change in the bad direction
+            loss = -change if higher_is_better else change
+            report.append(line)
+            limit = timing_threshold if timing else threshold
+            if loss > limit:
+                regressions.append(line)
+    return regressions, report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark of the Yote engine")
+    parser.add_argument('--depth', type=int, default=3, help="maximum search depth")
+    parser.add_argument('--repeat', type=int, default=5, help="number of rounds of measures of all the positions, the median measures being kept")
+    parser.add_argument('--min-seconds', type=float, default=0.5, help="duration of each throughput measure, shared by the rounds")
+    parser.add_argument('--output', help="file to write the results to (default: stdout)")
+    parser.add_argument('--baseline', help="results of a previous run to compare with")
+    parser.add_argument('--threshold', type=float, default=0.10, help="relative regression of a deterministic metric that fails the comparison")
+    parser.add_argument('--timing-threshold', type=float, default=0.25, help="relative regression of a timing that fails the comparison")
+    args = parser.parse_args()
+
+    results = run(args.depth, args.repeat, args.min_seconds)
+    if args.output is None:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions, report = compare(results, baseline, args.threshold, args.timing_threshold)
+        for line in report:
+            print(line, file=sys.stderr)
+        if len(regressions) > 0:
+            print(f"FAIL: {len(regressions)} regression(s)", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            sys.exit(1)
+        print("PASS", file=sys.stderr)
@@ -0,0 +1,330 @@
+"""
+A local engine service playing Yote for many game sessions at once.
+
+Requests and responses are line-delimited JSON, read from stdin and written to stdout, or exchanged over a Unix socket.
+Every request names a game session and a command, for example:
+    {"id": 1, "session": "g1", "cmd": "new"}
+    {"id": 2, "session": "g1", "cmd": "position", "moves": [[[2, 3], "h"], [[1, 3], "h"]]}
+    {"id": 3, "session": "g1", "cmd": "move", "move": [[2, 3], [2, 4], "b"]}
+    {"id": 4, "session": "g1", "cmd": "go", "depth": 4, "deadline_ms": 2000}
+    {"id": 5, "session": "g1", "cmd": "close"}
+Moves use the format of Yote.possible_moves() with positions as lists.
+
+The games of the sessions are kept by the service, and their searches run in a bounded pool of worker processes.
+No search state is kept between the moves of a session: every search starts with a new AI, in any worker.
+"""
+import argparse
+import asyncio
+import copy
+import json
+import os
+import stat
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from experiments import Yote, AI
+
+
+def _search(game: Yote, depth: int, max_player: bool, deadline: float):
+    """
+    Runs in a worker process: searches the best move of a game before the deadline (a time.time() value, or None)
+    """
+    ai = AI(game.nplayer)
+    time_limit = None if deadline is None else max(deadline - time.time(), 0)
+    move, value = ai.choose_best_move(game, depth, max_player, time_limit=time_limit)
+    return move_to_json(move), float(value), ai.nodes
+
+
+def move_to_json(move):
+    """
+    Converts a move of Yote.possible_moves() into lists and strings that can be written as JSON
+    """
+    return [[int(coordinate) for coordinate in part] if isinstance(part, tuple) else part for part in move]
+
+
+def move_from_json(move):
+    """
+    Converts a move read from JSON back into the tuple format of Yote.possible_moves(), raising ValueError if it is malformed
+    """
+    if not isinstance(move, list) or len(move) == 0:
+        raise ValueError(f"malformed move {move!r}")
+    parts = []
+    for part in move:
+        if isinstance(part, list) and len(part) == 2 and all(isinstance(coordinate, int) and not isinstance(coordinate, bool) for coordinate in part):
+            parts.append(tuple(part))
+        elif isinstance(part, str):
+            parts.append(part)
+        else:
+            raise ValueError(f"malformed move {move!r}")
+    return tuple(parts)
+
+
+def find_move(game: Yote, move):
+    """
+    Returns the possible move of the game equal to a move read from JSON, or None if the move is not legal
+    """
+    move = move_from_json(move)
+    for possible_move in game.possible_moves():
+        if possible_move == move:
+            return possible_move
+    return None
+
+
+class Session:
+    def __init__(self):
+        self.__game = Yote()
+
+
+    @property
+    def game(self):
+        return self.__game
+
+
+    def reset(self):
+        self.__game = Yote()
+
+
+class EngineService:
+    def __init__(self, workers: int, max_pending: int, default_depth: int = 4):
+        self.__pool = ProcessPoolExecutor(max_workers=workers)
+        # the number of searches that can be queued or running at once; reading requests stops when it is reached
+        self.__max_pending = max_pending
+        self.__pending = None
+        self.__default_depth = default_depth
+        # the extra time given to a worker after the deadline of a request before answering that the deadline was exceeded
+        self.__grace_period = 1.0
+        self.__sessions = {}
+
+
+    def __session(self, name: str, create: bool = False):
+        session = self.__sessions.get(name)
+        if session is None:
+            if not create:
+                raise ValueError(f"unknown session {name!r}")
+            session = self.__sessions[name] = Session()
+        return session
+
+
+    def __play(self, session: Session, move):
+        possible_move = find_move(session.game, move)
+        if possible_move is None:
+            raise ValueError(f"illegal move {move!r}")
+        session.game.play_move(possible_move)
+
+
+    def __status(self, session: Session):
+        is_over, winner = session.game.is_over()
+        return {'turn': session.game.nplayer, 'over': is_over, 'winner': winner}
+
+
+    def __handle(self, request: dict):
+        """
+        Handles the commands that change the state of a session, which are cheap enough to run in the event loop
+        """
+        command = request.get('cmd')
+        name = request.get('session')
+        if command == 'new':
+            session = self.__session(name, create=True)
+            session.reset()
+            return self.__status(session)
+        if command == 'position':
+            session = self.__session(name, create=True)
+            session.reset()
+            moves = request.get('moves', [])
+            if not isinstance(moves, list):
+                raise ValueError(f"malformed moves {moves!r}")
+            for move in moves:
+                self.__play(session, move)
+            return self.__status(session)
+        if command == 'move':
+            session = self.__session(name)
+            self.__play(session, request['move'])
+            return self.__status(session)
+        if command == 'close':
+            self.__sessions.pop(name, None)
+            return {}
+        raise ValueError(f"unknown command {command!r}")
+
+
+    def __go(self, request: dict):
+        """
+        Submits the search of a "go" request to the pool and returns the future of its result.
+        The game is copied at once, so that the next requests of the session do not change the searched position.
+        The search slot taken by the request is freed when the search itself ends, even if nobody waits for it anymore.
+        """
+        session = self.__session(request.get('session'))
+        if session.game.is_over()[0]:
+            raise ValueError("the game is over")
+
+        depth = request.get('depth', self.__default_depth)
+        if not isinstance(depth, int) or isinstance(depth, bool) or depth < 1:
+            raise ValueError(f"invalid depth {depth!r}")
+        deadline_ms = request.get('deadline_ms')
+        if deadline_ms is not None and (not isinstance(deadline_ms, (int, float)) or isinstance(deadline_ms, bool) or deadline_ms <= 0):
+            raise ValueError(f"invalid deadline_ms {deadline_ms!r}")
+        # the white player is the max player, as in the games played by experiments.py and yote_gui.py
+        max_player = session.game.nplayer == 1
+        deadline = None if deadline_ms is None else time.time() + deadline_ms / 1000
+
+        loop = asyncio.get_running_loop()
+        search = self.__pool.submit(_search, copy.deepcopy(session.game), depth, max_player, deadline)
+        search.add_done_callback(lambda _: loop.call_soon_threadsafe(self.__pending.release))
+        return asyncio.wrap_future(search)
+
+
+    async def __answer(self, request: dict, search: asyncio.Future, writer: asyncio.StreamWriter):
+        response = {'id': request.get('id'), 'session': request.get('session')}
+        deadline_ms = request.get('deadline_ms')
+        timeout = None if deadline_ms is None else deadline_ms / 1000 + self.__grace_period
+        try:
+            move, value, nodes = await asyncio.wait_for(search, timeout)
+            response.update({'move': move, 'value': value, 'nodes': nodes})
+        except asyncio.TimeoutError:
+            response['error'] = "deadline exceeded"
+        except Exception as error:
+            response['error'] = f"search failed: {error!r}"
+        await self.__respond(writer, response)
+
+
+    async def __respond(self, writer: asyncio.StreamWriter, response: dict):
+        writer.write((json.dumps(response) + '\n').encode())
+        await writer.drain()
+
+
+    async def serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Serves the requests of one connection until its end.
+        A "go" request is answered when its search is done, the other requests are answered in order.
+        """
+        if self.__pending is None:
+            self.__pending = asyncio.Semaphore(self.__max_pending)
+        searches = set()
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as error:
+                await self.__respond(writer, {'error': f"invalid request: {error}"})
+                continue
+            if not isinstance(request, dict):
+                await self.__respond(writer, {'error': "invalid request: not a JSON object"})
+                continue
+
+            response = {'id': request.get('id'), 'session': request.get('session')}
+            try:
+                if request.get('cmd') == 'go':
+                    # backpressure: the next requests are not read until a search slot is free
+                    await self.__pending.acquire()
+                    try:
+                        search = self.__go(request)
+                    except BaseException:
+                        # the search was not submitted, so its slot is not freed by its end
+                        self.__pending.release()
+                        raise
+                    answer = asyncio.create_task(self.__answer(request, search, writer))
+                    searches.add(answer)
+                    answer.add_done_callback(searches.discard)
+                    continue
+                response.update(self.__handle(request))
+            except (KeyError, ValueError) as error:
+                response['error'] = str(error)
+            except Exception as error:
+                # a request that fails unexpectedly is answered with an error, without stopping the service
+                response['error'] = f"request failed: {error!r}"
+            await self.__respond(writer, response)
+
+        await asyncio.gather(*searches)
+        writer.close()
+
+
+    def shutdown(self):
+        self.__pool.shutdown(cancel_futures=True)
+
+
+class _FileReader:
+    """
+    Reads the lines of a file that the event loop can not watch (a regular file) in a thread, like an asyncio.StreamReader
+    """
+    def __init__(self, file):
+        self.__file = file
+
+
+    async def readline(self):
+        return await asyncio.get_running_loop().run_in_executor(None, self.__file.readline)
+
+
+class _FileWriter:
+    """
+    Writes to a file that the event loop can not watch (a regular file) directly, like an asyncio.StreamWriter
+    """
+    def __init__(self, file):
+        self.__file = file
+
+
+    def write(self, data: bytes):
+        self.__file.write(data)
+
+
+    async def drain(self):
+        self.__file.flush()
+
+
+    def close(self):
+        self.__file.flush()
+
+
+def _is_pipe(file):
+    """
+    Checks whether the event loop can watch a file: a pipe, a socket or a terminal
+    """
+    mode = os.fstat(file.fileno()).st_mode
+    return stat.S_ISFIFO(mode) or stat.S_ISSOCK(mode) or stat.S_ISCHR(mode)
+
+
+async def _stdio_streams():
+    """
+    Returns a reader on stdin and a writer on stdout for the event loop.
+    When they are redirected from or to regular files, they are read in a thread and written directly.
+    """
+    loop = asyncio.get_running_loop()
+    if _is_pipe(sys.stdin):
+        reader = asyncio.StreamReader()
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    else:
+        reader = _FileReader(sys.stdin.buffer)
+    if _is_pipe(sys.stdout):
+        transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, sys.stdout)
+        writer = asyncio.StreamWriter(transport, protocol, None, loop)
+    else:
+        writer = _FileWriter(sys.stdout.buffer)
+    return reader, writer
+
+
+async def main(args: argparse.Namespace):
+    service = EngineService(args.workers, args.max_pending, args.depth)
+    try:
+        if args.socket is None:
+            reader, writer = await _stdio_streams()
+            await service.serve(reader, writer)
+        else:
+            server = await asyncio.start_unix_server(service.serve, path=args.socket)
+            async with server:
+                await server.serve_forever()
+    finally:
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Yote engine service speaking line-delimited JSON")
+    parser.add_argument('--socket', help="path of a Unix socket to listen on instead of stdin/stdout")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument('--max-pending', type=int, default=None, help="number of searches queued or running at once (default: 2 per worker)")
+    parser.add_argument('--depth', type=int, default=4, help="search depth of the \"go\" requests that do not give one")
+    args = parser.parse_args()
+    if args.max_pending is None:
+        args.max_pending = 2 * args.workers
+    asyncio.run(main(args))
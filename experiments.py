@@ -1,10 +1,16 @@
 from __future__ import annotations
 import numpy as np
-from math import inf
+from math import inf, nextafter
+import time
 
 
 class Yote:
-    def __init__(self):
+    # random keys of the stones of each position of the board, used to hash the positions of the game (Zobrist hashing)
+    # the seed is fixed so that the hashes of a position are the same in every process
+    __zobrist_keys = np.random.default_rng(20).integers(0, 2 ** 63, size=(5, 6, 2), dtype=np.int64).tolist()
+    __zobrist_turn_key = int(np.random.default_rng(21).integers(0, 2 ** 63, dtype=np.int64))
+
+    def __init__(self, repetition_limit: int = 3, move_limit: int = 100):
         # the white player is always the first on the list of players and the first to play
         self.nplayer = 1
         
@@ -30,6 +36,18 @@ class Yote:
         # scoring (aka evaluation function) weights
         self.__scoring_weights = np.array([0.4, 0.25, 0.15, 0.12, 0.08])
 
+        # DRAW RULES (None disables a rule)
+        # the game is drawn when the same position occurs this number of times
+        self.__repetition_limit = repetition_limit
+        # the game is drawn after this number of moves without placing a stone or capturing
+        self.__move_limit = move_limit
+        # the Zobrist hash of the stones on the board
+        self.__board_hash = 0
+        # the hashes of the positions of the game, the current one being the last
+        self.__positions = [self.position_hash]
+        # the number of moves played since the last placement or capture; the positions before can not occur again
+        self.__reversible_moves = 0
+
 
     @property
     def white_pos(self):
@@ -69,6 +87,44 @@ class Yote:
     @property
     def black_captures(self):
         return self.__black_captures
+    
+
+    @property
+    def scoring_weights(self):
+        return self.__scoring_weights
+    
+
+    @property
+    def board_hash(self):
+        return self.__board_hash
+    
+
+    @property
+    def position_hash(self):
+        if self.nplayer == 2:
+            return self.__board_hash ^ self.__zobrist_turn_key
+        return self.__board_hash
+    
+
+    @property
+    def history_length(self):
+        return len(self.__positions)
+    
+
+    @property
+    def reversible_moves(self):
+        return self.__reversible_moves
+    
+
+    @property
+    def move_limit(self):
+        return self.__move_limit
+
+
+    @property
+    def reversible_positions(self):
+        # the hashes of the positions since the last placement or capture (the current one included), the only ones that can occur again
+        return tuple(self.__positions[max(len(self.__positions) - 1 - self.__reversible_moves, 0):])
 
 
     def __empty_board_positions(self):
@@ -215,41 +271,46 @@ class Yote:
         return poss_moves
 
 
+    def __set_position(self, pos, value):
+        """
+        Puts a stone (or the empty value) on a position of the board and keeps the hash of the board up to date
+        """
+        i, j = pos
+        previous = self.__board[i, j]
+        if previous != self.__empty_pos:
+            self.__board_hash ^= self.__zobrist_keys[i][j][0 if previous == self.__white_pos else 1]
+        if value != self.__empty_pos:
+            self.__board_hash ^= self.__zobrist_keys[i][j][0 if value == self.__white_pos else 1]
+        self.__board[i, j] = value
+
+
     def __make_move(self, move):
         if 'h' in move:
-            i, j = move[0]
             if self.nplayer == 1:
-                self.__board[i, j] = self.__white_pos
+                self.__set_position(move[0], self.__white_pos)
                 self.__num_of_white_stones -= 1
             else:
-                self.__board[i, j] = self.__black_pos
+                self.__set_position(move[0], self.__black_pos)
                 self.__num_of_black_stones -= 1
         elif 'b' in move:
-            (src_i, src_j), (des_i, des_j) = move[:2]
-            self.__board[src_i, src_j] = self.__empty_pos
+            self.__set_position(move[0], self.__empty_pos)
             if self.nplayer == 1:
-                self.__board[des_i, des_j] = self.__white_pos
+                self.__set_position(move[1], self.__white_pos)
             else:
-                self.__board[des_i, des_j] = self.__black_pos
+                self.__set_position(move[1], self.__black_pos)
         else:
-            src_i, src_j = move[0]
-            self.__board[src_i, src_j] = self.__empty_pos
-
-            des_i, des_j = move[1]
-
-            captured_i, captured_j = move[3]
-            self.__board[captured_i, captured_j] = self.__empty_pos
+            self.__set_position(move[0], self.__empty_pos)
+            self.__set_position(move[3], self.__empty_pos)
 
             if self.nplayer == 1:
-                self.__board[des_i, des_j] = self.__white_pos
+                self.__set_position(move[1], self.__white_pos)
                 self.__white_captures += 1
             else:
-                self.__board[des_i, des_j] = self.__black_pos
+                self.__set_position(move[1], self.__black_pos)
                 self.__black_captures += 1
 
             if len(move) == 5:
-                to_throw_i, to_throw_j = move[4]
-                self.__board[to_throw_i, to_throw_j] = self.__empty_pos
+                self.__set_position(move[4], self.__empty_pos)
                 if self.nplayer == 1:
                     self.__white_captures += 1
                 else:
@@ -260,6 +321,28 @@ class Yote:
         self.__make_move(move)
         # change the turn to the next player
         self.nplayer = 2 if self.nplayer == 1 else 1
+        # placing a stone or capturing can not be undone, so the previous positions can not occur again
+        self.__reversible_moves = self.__reversible_moves + 1 if 'b' in move else 0
+        self.__positions.append(self.position_hash)
+
+
+    def repetitions(self):
+        """
+        Returns the number of times the current position occurred before in the game
+        """
+        position_hash = self.position_hash
+        # only the positions since the last placement or capture, with the same player to move, can be the same
+        first = len(self.__positions) - 1 - self.__reversible_moves
+        return self.__positions[max(first, 0):-1][::-1][1::2].count(position_hash)
+
+
+    def is_draw(self):
+        """
+        Checks whether the match is drawn by repetition or by the move limit
+        """
+        if self.__repetition_limit is not None and self.repetitions() + 1 >= self.__repetition_limit:
+            return True
+        return self.__move_limit is not None and self.__reversible_moves >= self.__move_limit
 
 
     def is_over(self):
@@ -268,19 +351,39 @@ class Yote:
         """
         # if either the white or the black player captures all the stones of the opponent, then the game is finihed, and (True, num_of_winner) is returned
         # if the current player can not make any move, then the opponent wins, and (True, num_of_winner) is returned.
+        # if the match is drawn by repetition or by the move limit, then the game is finished without a winner, and (True, None) is returned
         # else the game is not over, and (Fasle, None) is returned
         if self.nplayer == 1:   
             if self.__black_captures == 12 or len(self.possible_moves()) == 0:
                 return True, 2
-            return False, None
         if self.nplayer == 2:
             if self.__white_captures == 12 or len(self.possible_moves()) == 0:
                 return True, 1
-            return False, None
+        if self.is_draw():
+            return True, None
+        return False, None
     
 
-    def scoring(self):
-        possible_moves = self.possible_moves()
+    def count_quiet_moves(self):
+        """
+        Returns the number of moves of the current player that are not captures ('h' and 'b'), like possible_moves() but without generating them
+        """
+        own_stone = self.__white_pos if self.nplayer == 1 else self.__black_pos
+        in_hand = self.__num_of_white_stones if self.nplayer == 1 else self.__num_of_black_stones
+        mine = self.__board == own_stone
+        empty = self.__board == self.__empty_pos
+        # rule-1: placing a stone from the hand on an empty position
+        count = int(np.count_nonzero(empty)) if in_hand > 0 else 0
+        # rule-2: moving a stone to an empty adjacent position (top, bottom, left and right)
+        count += int(np.count_nonzero(mine[1:, :] & empty[:-1, :]) + np.count_nonzero(mine[:-1, :] & empty[1:, :])
+                     + np.count_nonzero(mine[:, 1:] & empty[:, :-1]) + np.count_nonzero(mine[:, :-1] & empty[:, 1:]))
+        return count
+
+
+    def scoring(self, possible_moves=None):
+        # the possible moves of the current player can be passed to avoid generating them twice
+        if possible_moves is None:
+            possible_moves = self.possible_moves()
         criteria = np.empty(5)
         criteria[1] = len(tuple(filter(lambda move: 'c' in move, possible_moves)))
         criteria[2] = len(possible_moves) - criteria[1]
@@ -303,6 +406,27 @@ class Yote:
         self.__num_of_black_stones = state.black_stones_in_hand
         self.__white_captures = state.white_captures
         self.__black_captures = state.black_captures
+        self.__board_hash = state.board_hash
+        self.__reversible_moves = state.reversible_moves
+        # the state is a previous state of this game, so the positions played after it are forgotten
+        del self.__positions[state.history_length:]
+
+
+    def load_position(self, board, nplayer: int, white_in_hand: int, black_in_hand: int, white_captures: int, black_captures: int):
+        """
+        Sets the game to a position given by its board and counters; the position becomes the start of the history of the game
+        """
+        self.nplayer = nplayer
+        self.__board = np.zeros((5, 6), dtype=np.int32)
+        self.__board_hash = 0
+        for i, j in zip(*np.nonzero(board)):
+            self.__set_position((i, j), board[i, j])
+        self.__num_of_white_stones = white_in_hand
+        self.__num_of_black_stones = black_in_hand
+        self.__white_captures = white_captures
+        self.__black_captures = black_captures
+        self.__positions = [self.position_hash]
+        self.__reversible_moves = 0
 
 
     def test(self):
@@ -317,6 +441,9 @@ class GameState:
         self.__black_stones_in_hand = game.in_hand_black_stones
         self.__white_captures = game.white_captures
         self.__black_captures = game.black_captures
+        self.__board_hash = game.board_hash
+        self.__history_length = game.history_length
+        self.__reversible_moves = game.reversible_moves
         self.__scoring = game.scoring()
 
     
@@ -350,6 +477,21 @@ class GameState:
         return self.__black_captures
     
 
+    @property
+    def board_hash(self):
+        return self.__board_hash
+    
+
+    @property
+    def history_length(self):
+        return self.__history_length
+    
+
+    @property
+    def reversible_moves(self):
+        return self.__reversible_moves
+    
+
     @property
     def scoring(self):
         return self.__scoring
@@ -392,59 +534,560 @@ class Player:
         return self.__turn
 
 
+class SearchTimeout(Exception):
+    """
+    Raised inside the search of the AI when its time limit is reached
+    """
+
+
+class ProofNumberSolver:
+    """
+    Depth-first proof-number search (df-pn) proving that the player to move forces a win,
+    by capturing 12 stones or by leaving the opponent without moves.
+    The numbers are kept from the side of the player to move of each position: phi is the proof number of its goal
+    (winning for the attacker, not losing for the defender) and delta is the disproof number of that goal.
+    Draws and repetitions count as failures of the attacker.
+    """
+    # the proof or disproof number of a goal that can not be reached
+    INFINITY = 10 ** 12
+
+    def __init__(self, max_entries: int = 200000):
+        # a transposition table for each attacker, since draws are scored against the attacker: key -> (phi, delta)
+        self.__tables = {1: {}, 2: {}}
+        self.__table = None
+        # the number of entries of a table before its unsolved positions are dropped
+        self.__max_entries = max_entries
+        self.__attacker = None
+        # the number of positions expanded by the last call of solve and the maximum allowed
+        self.__nodes = 0
+        self.__max_nodes = 0
+        # the time (a time.monotonic() value) at which the last call of solve gives up, None when it is not limited
+        self.__deadline = None
+
+
+    @property
+    def nodes(self):
+        return self.__nodes
+
+
+    def __key(self, game: Yote):
+        # the moves played towards the move limit are part of the key, since a position is drawn when it reaches the limit;
+        # they are counted up to the limit only, and not at all when the game has no move limit
+        reversible_moves = 0 if game.move_limit is None else min(game.reversible_moves, game.move_limit)
+        return (game.position_hash, game.in_hand_white_stones, game.in_hand_black_stones, game.white_captures, game.black_captures,
+                reversible_moves)
+
+
+    def __draw(self, game: Yote):
+        if game.nplayer == self.__attacker:
+            return self.INFINITY, 0
+        return 0, self.INFINITY
+
+
+    def __terminal(self, game: Yote):
+        """
+        Returns the (phi, delta) of a finished game, or None if the game is not over
+        """
+        is_over, winner = game.is_over()
+        if not is_over:
+            return None
+        if winner is None:
+            return self.__draw(game)
+        if winner == game.nplayer:
+            return 0, self.INFINITY
+        return self.INFINITY, 0
+
+
+    def __store(self, key, numbers):
+        if len(self.__table) >= self.__max_entries:
+            # the solved positions are the most valuable entries, the others are dropped first
+            solved = {key: entry for key, entry in self.__table.items() if entry[0] == 0 or entry[1] == 0}
+            self.__table.clear()
+            if len(solved) < self.__max_entries * 3 // 4:
+                self.__table.update(solved)
+        self.__table[key] = numbers
+
+
+    def __children(self, game: Yote):
+        """
+        Returns the moves of a position with the key of the position they lead to,
+        and the fixed numbers of the moves repeating a position (which can not be shared through the table)
+        """
+        original_state = GameState(game)
+        children = []
+        for move in game.possible_moves():
+            game.play_move(move)
+            key = self.__key(game)
+            fixed = None
+            if game.repetitions() > 0:
+                fixed = self.__draw(game)
+            elif key not in self.__table:
+                terminal = self.__terminal(game)
+                if terminal is not None:
+                    self.__store(key, terminal)
+            children.append((move, key, fixed))
+            game.restore(original_state)
+        return children
+
+
+    def __child_numbers(self, child):
+        move, key, fixed = child
+        if fixed is not None:
+            return fixed
+        return self.__table.get(key, (1, 1))
+
+
+    def __exhausted(self):
+        """
+        Checks whether the node budget or the time of the solver is used up
+        """
+        return self.__nodes >= self.__max_nodes or (self.__deadline is not None and time.monotonic() >= self.__deadline)
+
+
+    def __search(self, game: Yote, threshold_phi: int, threshold_delta: int):
+        """
+        Expands a position until its phi or delta reaches its threshold, or the node budget or the time is exhausted
+        """
+        self.__nodes += 1
+        key = self.__key(game)
+        original_state = GameState(game)
+        children = self.__children(game)
+        while True:
+            numbers = [self.__child_numbers(child) for child in children]
+            phi = min(delta for _, delta in numbers)
+            delta = min(sum(phi for phi, _ in numbers), self.INFINITY)
+            if phi >= threshold_phi or delta >= threshold_delta or self.__exhausted():
+                self.__store(key, (phi, delta))
+                return phi, delta
+
+            # the most proving child has the smallest delta; the second one bounds how long it is searched
+            best = min(range(len(children)), key=lambda index: numbers[index][1])
+            second_delta = min((numbers[index][1] for index in range(len(children)) if index != best), default=self.INFINITY)
+            child_phi, child_delta = numbers[best]
+            child_threshold_phi = min(threshold_delta - delta + child_phi, self.INFINITY)
+            child_threshold_delta = min(threshold_phi, second_delta + 1)
+
+            game.play_move(children[best][0])
+            self.__search(game, child_threshold_phi, child_threshold_delta)
+            game.restore(original_state)
+
+
+    def solve(self, game: Yote, max_nodes: int, deadline: float = None):
+        """
+        Tries to prove that the player to move forces a win, expanding at most about max_nodes positions
+        and giving up at the deadline (a time.monotonic() value) if any.
+        Returns a winning move, or None when the win is not proven.
+        """
+        self.__attacker = game.nplayer
+        self.__table = self.__tables[game.nplayer]
+        self.__nodes = 0
+        self.__max_nodes = max_nodes
+        self.__deadline = deadline
+        if game.is_over()[0]:
+            return None
+
+        phi, delta = self.__search(game, self.INFINITY, self.INFINITY)
+        if phi != 0:
+            return None
+        # the winning move leads to a position where the goal of the defender is disproven
+        for move, key, fixed in self.__children(game):
+            if self.__child_numbers((move, key, fixed))[1] == 0:
+                return move
+        return None
+
+
 class AI(Player):
-    def __alpha_beta_pruning(self, game: Yote, depth: int, alpha: float, beta: float, max_player: bool):
+    def __init__(self, turn: int, quiescence: bool = False, late_move_reductions: bool = False, futility_pruning: bool = False, evaluator=None, solver: bool = False):
+        super().__init__(turn)
+        # the number of positions visited by the last search
+        self.__nodes = 0
+        # the depth of the last iteration completed by the last search, lower than the requested depth when the time limit was reached
+        self.__depth = 0
+        # the half-width of the aspiration window opened around the score of a previous iteration
+        self.__aspiration_window = 0.5
+        # the time at which a search with a time limit must stop, None when the search is not limited
+        self.__deadline = None
+        # the value of a draw is lowered by this much for every capture of lead of the player to move,
+        # so that the player who leads avoids the draw and the player who is behind looks for it
+        self.__contempt = 0.4
+
+        # SELECTIVE SEARCH (each part can be switched off to compare with the plain search)
+        # extend the leaves with a search on captures only, so that the scoring is not trusted in the middle of an exchange
+        self.__quiescence = quiescence
+        # the maximum number of captures played by the quiescence search after a leaf
+        self.__quiescence_depth = 2
+        # search the late quiet moves one ply shallower and only search them again at full depth if they fail high
+        self.__late_move_reductions = late_move_reductions
+        # the number of moves of a node searched at full depth before reducing the quiet ones
+        self.__late_move_index = 3
+        # the minimum remaining depth at which quiet moves are reduced; the root moves are never reduced,
+        # so the reductions only change searches of depth 4 or more
+        self.__reduction_min_depth = 3
+        # skip the quiet moves of the frontier nodes that can not raise the value above alpha; the frontier nodes are the
+        # nodes one ply above the leaves, so in a search of depth 2 only the replies to the root moves are pruned, which saves few nodes
+        self.__futility_pruning = futility_pruning
+
+        # an optional pattern evaluator (see ntuple.NTupleEvaluator) whose evaluation is added to the scoring of the game
+        self.__evaluator = evaluator
+
+        # PROOF-NUMBER SOLVER (used instead of the search when a proven win is likely)
+        # the solver keeps its table between the moves of the game
+        self.__solver = ProofNumberSolver() if solver else None
+        # the number of positions the solver may expand before giving up
+        self.__solver_nodes = 1000
+        # the lead in captures of the player to move from which the solver is tried
+        self.__solver_threshold = 4
+        # the share of the time limit of a search that the solver may use, the rest being left to the search
+        self.__solver_time_share = 0.5
+
+
+    @property
+    def nodes(self):
+        return self.__nodes
+    
+
+    @property
+    def depth(self):
+        return self.__depth
+    
+
+    @property
+    def quiescence(self):
+        return self.__quiescence
+    
+
+    @property
+    def late_move_reductions(self):
+        return self.__late_move_reductions
+    
+
+    @property
+    def futility_pruning(self):
+        return self.__futility_pruning
+    
+
+    @property
+    def evaluator(self):
+        return self.__evaluator
+    
+
+    @property
+    def solver(self):
+        return self.__solver
+
+
+    def __lead(self, game: Yote):
+        """
+        Returns the number of captures by which the player to move leads
+        """
+        if game.nplayer == 1:
+            return game.white_captures - game.black_captures
+        return game.black_captures - game.white_captures
+
+
+    def __is_lopsided(self, game: Yote):
+        """
+        Checks whether the player to move leads by enough captures to try to prove a win
+        """
+        return self.__lead(game) >= self.__solver_threshold
+
+
+    def __check_deadline(self):
+        """
+        Stops the search when its time limit is reached, the clock being read every 128 nodes only
+        """
+        if self.__deadline is not None and self.__nodes % 128 == 0 and time.monotonic() >= self.__deadline:
+            raise SearchTimeout()
+
+
+    def __score(self, game: Yote, possible_moves=None):
+        """
+        Returns the scoring of the game from the side of the player to move, with the evaluation of the pattern evaluator if any
+        """
+        score = game.scoring(possible_moves)
+        if self.__evaluator is not None:
+            score += self.__evaluator.evaluate(game)
+        return score
+
+
+    def __draw_value(self, game: Yote, color: int):
+        """
+        Returns the value of a drawn or repeated position seen from the side of the player to move, like the principal variation search:
+        the scoring of the position minus the contempt for every capture of lead of the player to move
+        """
+        return color * self.__score(game) - self.__contempt * self.__lead(game)
+
+
+    def __ordered_moves(self, game: Yote):
+        """
+        Returns the possible moves of the current player with captures first, since they are the most likely to cause a cutoff
+        """
+        return sorted(game.possible_moves(), key=lambda move: 'c' not in move)
+
+
+    def __quiescence_search(self, game: Yote, alpha: float, beta: float, color: int, depth: int):
+        """
+        Searches the captures only until the position is quiet, the player to move being allowed to stand pat on the scoring.
+        The returned value is seen from the side of the player to move, like in the principal variation search.
+        """
+        self.__nodes += 1
+        self.__check_deadline()
+        if game.repetitions() > 0 or game.is_draw():
+            return self.__draw_value(game, color)
+        if game.is_over()[0]:
+            return color * self.__score(game)
+
+        possible_moves = game.possible_moves()
+        stand_pat = color * self.__score(game, possible_moves)
+        if depth == 0 or stand_pat >= beta:
+            return stand_pat
+
+        original_state = GameState(game)
+        best_value = stand_pat
+        alpha = max(alpha, stand_pat)
+        for move in self.__quiescence_captures(game, possible_moves):
+            game.play_move(move)
+            value = -self.__quiescence_search(game, -beta, -alpha, -color, depth - 1)
+            game.restore(original_state)
+            best_value = max(best_value, value)
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break  # beta-cutoff
+
+        return best_value
+    
+
+    def __quiescence_captures(self, game: Yote, possible_moves: list):
+        """
+        Returns the captures searched by the quiescence search. The stone thrown away after a jump decides whether the opponent
+        can recapture, so every throw of an opponent stone able to capture is searched, these throws first.
+        The other throws of a jump are positional choices, and only the first one of them is searched.
+        """
+        captures = [move for move in possible_moves if 'c' in move]
+        if len(captures) == 0:
+            return captures
+
+        game.nplayer = 2 if game.nplayer == 1 else 1
+        attackers = {move[0] for move in game.possible_moves() if 'c' in move}
+        game.nplayer = 2 if game.nplayer == 1 else 1
+
+        tactical_throws = []
+        other_throws = {}
+        for move in captures:
+            if len(move) == 5 and move[4] in attackers:
+                tactical_throws.append(move)
+            else:
+                other_throws.setdefault(move[:4], move)
+        return tactical_throws + list(other_throws.values())
+
+
+    def __quiet_moves_bound(self, game: Yote, color: int, count_captures: bool = True):
+        """
+        Returns an optimistic bound of the value of the quiet moves ('h' and 'b') of a frontier node, used for futility pruning.
+        After a quiet move the value is the score of the opponent signed by color, so it is estimated with the score of the opponent
+        in the current position and a margin derived from the scoring weights:
+        - the opponent can lose all its capture moves and the 5 quiet moves to the cell taken by the stone,
+        - the opponent can gain two captures over the moved stone, each with a stone of the player to throw.
+        The capture moves of the opponent cancel out of the bound of the min player (color -1), and only raise the bound of the max player,
+        so without count_captures the moves of the opponent are not generated and the bound is exact for the min player
+        and a lower bound for the max player.
+        """
+        own_stone = game.white_pos if game.nplayer == 1 else game.black_pos
+        own_stones = int(np.count_nonzero(game.board == own_stone))
+        weights = game.scoring_weights
+
+        game.nplayer = 2 if game.nplayer == 1 else 1
+        opponent_captures = 0
+        if count_captures:
+            opponent_captures = len(tuple(filter(lambda move: 'c' in move, game.possible_moves())))
+        # the scoring is linear in the numbers of moves, which are added to the score of the opponent without its moves
+        opponent_score = self.__score(game, []) + weights[1] * opponent_captures + weights[2] * game.count_quiet_moves()
+        game.nplayer = 2 if game.nplayer == 1 else 1
+
+        if color == 1:
+            margin = weights[1] * (opponent_captures + 2 * (own_stones + 1)) + weights[2] * 5
+        else:
+            margin = weights[1] * opponent_captures + weights[2] * 5
+        if self.__evaluator is not None:
+            # the patterns of the opponent change in the windows of the cells changed by the move
+            margin += self.__evaluator.margin
+        return color * opponent_score + margin
+
+
+    def __principal_variation_search(self, game: Yote, depth: int, alpha: float, beta: float, color: int):
+        """
+        Negamax alpha-beta search with principal variation search (fail-soft).
+        The returned value is seen from the side of the player to move, color being 1 for the max player and -1 for the min player.
+        """
+        if depth == 0 and self.__quiescence:
+            return self.__quiescence_search(game, alpha, beta, color, self.__quiescence_depth)
+
+        self.__nodes += 1
+        self.__check_deadline()
+        # a position that occurred before in the game or in the searched variation is scored as a draw, since going around a cycle gains nothing
+        if game.repetitions() > 0 or game.is_draw():
+            return self.__draw_value(game, color)
         if depth == 0 or game.is_over()[0]:
-            return game.scoring()
-        
+            return color * self.__score(game)
+
+        # the bound of the quiet moves of a frontier node is only computed when its first quiet move is reached with a finite alpha,
+        # and with the moves of the opponent only when the bound without its capture moves does not show that nothing can be pruned
+        quiet_moves_floor = None
+        quiet_moves_bound = None
+        futile = depth == 1 and self.__futility_pruning
+
         original_state = GameState(game)  # saving the first game state which was passed as argument
-        if max_player:  # the turn is to the max player
-            value = -inf
-            for move in game.possible_moves():
-                game.play_move(move)
-                value = max(value, self.__alpha_beta_pruning(game, depth - 1, alpha, beta, False))
-                game.restore(original_state)  # restore the original state for the next iteration
+        best_value = -inf
+        for index, move in enumerate(self.__ordered_moves(game)):
+            quiet = 'c' not in move
+            if quiet and futile and alpha != -inf:
+                if quiet_moves_floor is None:
+                    quiet_moves_floor = self.__quiet_moves_bound(game, color, count_captures=False)
+                    if color == -1:
+                        quiet_moves_bound = quiet_moves_floor
+                if quiet_moves_bound is None and quiet_moves_floor <= alpha:
+                    quiet_moves_bound = self.__quiet_moves_bound(game, color)
+                if quiet_moves_bound is not None and quiet_moves_bound <= alpha:
+                    # futility pruning: the captures are ordered first, so none of the remaining moves can raise alpha
+                    best_value = max(best_value, quiet_moves_bound)
+                    break
+
+            game.play_move(move)
+            if index == 0:
+                # the first move is expected to be the best one, so it is searched with the full window
+                value = -self.__principal_variation_search(game, depth - 1, -beta, -alpha, -color)
+            else:
+                value = inf
+                if quiet and self.__late_move_reductions and index >= self.__late_move_index and depth >= self.__reduction_min_depth:
+                    # late move reduction: a late quiet move is first searched one ply shallower
+                    value = -self.__principal_variation_search(game, depth - 2, -nextafter(alpha, inf), -alpha, -color)
+                if value > alpha:
+                    # the other moves are searched with a null window to prove that they are not better than alpha
+                    value = -self.__principal_variation_search(game, depth - 1, -nextafter(alpha, inf), -alpha, -color)
+                    if alpha < value < beta:
+                        # fail-high: the move might be better, so it is searched again with the full window
+                        value = -self.__principal_variation_search(game, depth - 1, -beta, -alpha, -color)
+            game.restore(original_state)  # restore the original state for the next iteration
+            best_value = max(best_value, value)
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break  # beta-cutoff
+
+        return best_value
+
+
+    def __search_root(self, game: Yote, root_moves: list, depth: int, alpha: float, beta: float, color: int):
+        """
+        Searches the moves of the root position, sharing alpha between them.
+        root_moves is a list of (index, move) where index is the position of the move in game.possible_moves(),
+        ties are broken in favour of the lowest index so that the chosen move does not depend on the search order.
+        Returns the index of the best move and its value seen from the side of the player to move.
+        """
+        original_state = GameState(game)
+        best_index = None
+        best_value = -inf
+        for index, move in root_moves:
+            game.play_move(move)
+            if best_index is None:
+                value = -self.__principal_variation_search(game, depth - 1, -beta, -alpha, -color)
+            else:
+                # a move generated before the current best one must also win ties, so it is tested with value >= alpha
+                bound = nextafter(alpha, -inf) if index < best_index else alpha
+                value = -self.__principal_variation_search(game, depth - 1, -nextafter(bound, inf), -bound, -color)
+                if bound < value < beta:
+                    value = -self.__principal_variation_search(game, depth - 1, -beta, -bound, -color)
+            game.restore(original_state)
+            if best_index is None or value > best_value or (value == best_value and index < best_index):
+                best_index = index
+                best_value = value
                 alpha = max(alpha, value)
-                if alpha >= beta:
-                    break  # beta-cutoff
+            if alpha >= beta:
+                break  # the aspiration window failed high
 
-            return value
-        else:
-            value = inf
-            for move in game.possible_moves():
-                game.play_move(move)
-                value = min(value, self.__alpha_beta_pruning(game, depth - 1, alpha, beta, True))
-                game.restore(original_state)  # restore the original state for the next iteration
-                beta = min(beta, value)
-                if beta <= alpha:
-                    break  # alpha-cutoff
+        return best_index, best_value
 
-            return value
 
+    def evaluate(self, game: Yote, depth: int, max_player: bool, time_limit: float = None):
+        """
+        Returns the value of a position searched at depth, with the same sign convention as choose_best_move.
+        A repeated or drawn position has the draw value given to it by the search, whatever the depth.
+        At depth 0, or when the game is over, the value is the scoring of the position.
+        """
+        if game.repetitions() > 0 or game.is_draw():
+            color = 1 if max_player else -1
+            self.__nodes = 1
+            self.__depth = 0
+            return color * self.__draw_value(game, color)
+        if depth == 0 or game.is_over()[0]:
+            self.__nodes = 1
+            self.__depth = 0
+            return self.__score(game)
+        return self.choose_best_move(game, depth, max_player, time_limit)[1]
+
+
+    def choose_best_move(self, game: Yote, depth: int, max_player: bool, time_limit: float = None):
+        """
+        Iterative deepening over principal variation search.
+        Each iteration starts with an aspiration window around the score of the previous iteration of the same parity,
+        since the scoring is done from the side of the player to move and alternates between odd and even depths.
+        With a time limit (in seconds) the search stops when it is reached and returns the best move of the last completed iteration,
+        the proof-number solver, if any, being given a share of the time limit before the search.
+        """
+        start = time.monotonic()
+        self.__nodes = 0
+        self.__depth = 0
+        color = 1 if max_player else -1
+        root_moves = list(enumerate(game.possible_moves()))
+        if len(root_moves) == 0:
+            return None, color * -inf
+
+        if self.__solver is not None and self.__is_lopsided(game):
+            solver_deadline = None if time_limit is None else start + time_limit * self.__solver_time_share
+            move = self.__solver.solve(game, self.__solver_nodes, solver_deadline)
+            self.__nodes += self.__solver.nodes
+            if move is not None:
+                # the win is proven, there is nothing left to search
+                self.__depth = depth
+                return move, color * inf
 
-    def choose_best_move(self, game: Yote, depth: int, max_player: bool):
-        best_move = None
-        best_value = None
         original_state = GameState(game)
-        if max_player:  # the AI is playing as max player
-            best_value = -inf
-            for move in game.possible_moves():
-                game.play_move(move)
-                value = self.__alpha_beta_pruning(game, depth - 1, -inf, inf, False)
-                game.restore(original_state)
-                if value > best_value:
-                    best_value = value
-                    best_move = move
-        else:  # the AI is playing as a min player
-            best_value = inf
-            for move in game.possible_moves():
-                game.play_move(move)
-                value = self.__alpha_beta_pruning(game, depth - 1, -inf, inf, True)
-                game.restore(original_state)
-                if value < best_value:
-                    best_value = value
-                    best_move = move
-        return best_move, best_value
+        moves = dict(root_moves)
+        scores = []
+        best_index = None
+        best_value = None
+        for iteration in range(1, depth + 1):
+            # the first iteration is always completed, so that a move is available when the time limit is reached
+            if iteration > 1 and time_limit is not None:
+                self.__deadline = start + time_limit
+
+            if len(scores) == 0:
+                alpha, beta = -inf, inf
+            else:
+                guess = scores[-2] if len(scores) > 1 else scores[-1]
+                alpha, beta = guess - self.__aspiration_window, guess + self.__aspiration_window
+
+            try:
+                while True:
+                    index, value = self.__search_root(game, root_moves, iteration, alpha, beta, color)
+                    if value <= alpha and alpha != -inf:
+                        alpha = -inf  # fail-low: search again with an open lower bound
+                    elif value >= beta and beta != inf:
+                        beta = inf  # fail-high: search again with an open upper bound
+                    else:
+                        break
+            except SearchTimeout:
+                game.restore(original_state)  # the search was stopped in the middle of a variation
+                break
+
+            best_index = index
+            best_value = value
+            self.__depth = iteration
+            scores.append(best_value)
+            # the best move of this iteration is searched first in the next one
+            root_moves.sort(key=lambda root_move: root_move[0] != best_index)
+
+        self.__deadline = None
+        return moves[best_index], color * best_value
     
 
 class HumanPlayer(Player):
@@ -506,5 +1149,8 @@ if __name__ == "__main__":
         if is_over:
             break
     
-    winner_name = 'AI' if winner == ai.turn else 'Human'
-    print(f"{winner_name} won the game!")
+    if winner is None:
+        print("The game is drawn!")
+    else:
+        winner_name = 'AI' if winner == ai.turn else 'Human'
+        print(f"{winner_name} won the game!")
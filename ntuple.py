@@ -0,0 +1,123 @@
+"""
+N-tuple pattern evaluation of Yote positions.
+
+The board is covered by overlapping windows (rows, columns, 2x2 and 2x3 blocks). The stones of a window read as a ternary
+number index the weight table of the window, and the evaluation of a position is the sum of the weights of all its windows.
+The board is read from the side of the player to move (1 for its stones, 2 for the stones of the opponent), so that one set
+of tables scores the positions of both players.
+"""
+from __future__ import annotations
+import numpy as np
+from experiments import Yote
+
+
+def _windows():
+    """
+    Returns the windows of the board as lists of flat cell indices (row * 6 + column)
+    """
+    windows = []
+    for height, width in ((1, 6), (5, 1), (2, 2), (2, 3)):
+        for i in range(5 - height + 1):
+            for j in range(6 - width + 1):
+                windows.append([(i + di) * 6 + (j + dj) for di in range(height) for dj in range(width)])
+    return windows
+
+
+# the windows of the board, with their cells padded to the longest window; the padding cells have a power of 0
+_WINDOWS = _windows()
+_LENGTH = max(len(window) for window in _WINDOWS)
+_CELLS = np.array([window + [0] * (_LENGTH - len(window)) for window in _WINDOWS], dtype=np.intp)
+_POWERS = np.array([[3 ** k for k in range(len(window))] + [0] * (_LENGTH - len(window)) for window in _WINDOWS], dtype=np.intp)
+# the size and the offset of the table of every window in the flat array of weights
+_SIZES = np.array([3 ** len(window) for window in _WINDOWS], dtype=np.intp)
+_OFFSETS = np.concatenate(([0], np.cumsum(_SIZES)[:-1]))
+
+
+class NTupleEvaluator:
+    def __init__(self, weights: np.ndarray = None):
+        # the weight tables of all the windows, one after the other
+        if weights is None:
+            weights = np.zeros(_SIZES.sum())
+        assert weights.shape == (_SIZES.sum(),), "The weights do not match the windows of the board"
+        self.__weights = weights.astype(np.float64)
+        self.__margin = self.__compute_margin()
+
+
+    @property
+    def weights(self):
+        return self.__weights
+
+
+    @property
+    def margin(self):
+        return self.__margin
+
+
+    def __compute_margin(self):
+        """
+        Returns the largest change of the evaluation caused by changing two cells of the board, used by the futility pruning of the AI
+        """
+        spans = np.array([table.max() - table.min() for table in np.split(self.__weights, _OFFSETS[1:])])
+        cell_spans = np.zeros(30)
+        for window, span in zip(_WINDOWS, spans):
+            cell_spans[window] += span
+        return 2 * cell_spans.max()
+
+
+    def __indices(self, boards: np.ndarray):
+        """
+        Returns the indices in the flat weights of the windows of a batch of boards of shape (n, 30),
+        read from the side of the player whose stones are 1
+        """
+        digits = boards % 3  # empty: 0, stones of the player: 1, stones of the opponent (-1): 2
+        return _OFFSETS + (digits[:, _CELLS] * _POWERS).sum(axis=-1)
+
+
+    def evaluate_batch(self, boards: np.ndarray, turns: np.ndarray):
+        """
+        Evaluates a batch of boards of shape (n, 5, 6), each one from the side of its player to move (1 or 2 in turns)
+        """
+        boards = np.asarray(boards, dtype=np.intp).reshape(-1, 30)
+        # the stones of the black player become 1 when he/she is to move
+        signs = np.where(np.asarray(turns) == 1, 1, -1)
+        return self.__weights[self.__indices(boards * signs[:, None])].sum(axis=1)
+
+
+    def evaluate(self, game: Yote):
+        """
+        Evaluates the position of a game from the side of the player to move, like Yote.scoring()
+        """
+        board = game.board.reshape(1, 30).astype(np.intp)
+        if game.nplayer == 2:
+            board = -board
+        return self.__weights[self.__indices(board)].sum()
+
+
+    def update(self, boards: np.ndarray, turns: np.ndarray, targets: np.ndarray, learning_rate: float):
+        """
+        Moves the weights of a batch of positions towards target evaluations (one step of gradient descent on the mean squared error,
+        so that the step does not grow with the size of the batch)
+        """
+        boards = np.asarray(boards, dtype=np.intp).reshape(-1, 30)
+        signs = np.where(np.asarray(turns) == 1, 1, -1)
+        indices = self.__indices(boards * signs[:, None])
+        errors = np.asarray(targets) - self.__weights[indices].sum(axis=1)
+        np.add.at(self.__weights, indices, learning_rate * errors[:, None] / (indices.shape[1] * len(indices)))
+        self.__margin = self.__compute_margin()
+
+
+    def save(self, path: str):
+        """
+        Saves the weights as 16-bit integers with a scale, in a compressed .npz file
+        """
+        scale = np.abs(self.__weights).max() / np.iinfo(np.int16).max
+        if scale == 0:
+            scale = 1.0
+        quantized = np.round(self.__weights / scale).astype(np.int16)
+        np.savez_compressed(path, weights=quantized, scale=scale)
+
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as data:
+            return cls(data['weights'] * data['scale'])
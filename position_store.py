@@ -0,0 +1,277 @@
+"""
+A deduplicated store of Yote positions in sorted memory-mapped files.
+
+A position is packed into a 64-bit key:
+    bits 0-47:  the board as a base-3 number, cell (i, j) being the digit i * 6 + j (empty: 0, white: 1, black: 2)
+    bits 48-51: the stones in the hand of the white player
+    bits 52-55: the stones in the hand of the black player
+    bit 56:     the player to move (0: white, 1: black)
+The captures are not stored, since every stone of a player is either in his/her hand, on the board or captured.
+
+The store is a directory of .npy files: the sorted keys and one file per value column, all opened as read-only memory maps,
+so that the columns are read as NumPy arrays without loading them. Added positions are buffered, deduplicated and merged into
+new files of the next generation by flush(); a small manifest names the current generation.
+"""
+from __future__ import annotations
+import json
+import os
+import numpy as np
+from experiments import Yote
+
+
+_BOARD_BITS = 48
+_POWERS = 3 ** np.arange(30, dtype=np.int64)
+
+# the value columns of the store and their types
+COLUMNS = {
+    'evaluation': np.float32,  # the last evaluation given for the position (NaN when there is none)
+    'visits': np.uint32,  # the number of times the position was added
+    'wins': np.uint32,  # outcomes of the games, seen from the player to move
+    'draws': np.uint32,
+    'losses': np.uint32,
+}
+
+
+def encode_batch(boards: np.ndarray, white_in_hand: np.ndarray, black_in_hand: np.ndarray, turns: np.ndarray):
+    """
+    Packs a batch of positions (boards of shape (n, 5, 6)) into keys
+    """
+    digits = np.asarray(boards, dtype=np.int64).reshape(-1, 30) % 3  # black stones (-1) become 2
+    keys = (digits @ _POWERS).astype(np.uint64)
+    keys |= np.asarray(white_in_hand, dtype=np.uint64) << np.uint64(_BOARD_BITS)
+    keys |= np.asarray(black_in_hand, dtype=np.uint64) << np.uint64(_BOARD_BITS + 4)
+    keys |= (np.asarray(turns, dtype=np.uint64) - np.uint64(1)) << np.uint64(_BOARD_BITS + 8)
+    return keys
+
+
+def encode(game: Yote):
+    """
+    Packs the position of a game into a key
+    """
+    return int(encode_batch(game.board[None], [game.in_hand_white_stones], [game.in_hand_black_stones], [game.nplayer])[0])
+
+
+def decode_batch(keys: np.ndarray):
+    """
+    Unpacks a batch of keys into boards of shape (n, 5, 6), the stones in hand of both players and the players to move
+    """
+    keys = np.asarray(keys, dtype=np.uint64)
+    numbers = (keys & np.uint64((1 << _BOARD_BITS) - 1)).astype(np.int64)
+    digits = (numbers[:, None] // _POWERS) % 3
+    boards = np.where(digits == 2, -1, digits).astype(np.int32).reshape(-1, 5, 6)
+    white_in_hand = ((keys >> np.uint64(_BOARD_BITS)) & np.uint64(15)).astype(np.int32)
+    black_in_hand = ((keys >> np.uint64(_BOARD_BITS + 4)) & np.uint64(15)).astype(np.int32)
+    turns = ((keys >> np.uint64(_BOARD_BITS + 8)) & np.uint64(1)).astype(np.int32) + 1
+    return boards, white_in_hand, black_in_hand, turns
+
+
+def decode(key: int):
+    """
+    Returns a game set to the position of a key
+    """
+    boards, white_in_hand, black_in_hand, turns = decode_batch([key])
+    board = boards[0]
+    # the stones that are neither in hand nor on the board were captured by the opponent
+    white_captures = 12 - int(black_in_hand[0]) - int(np.count_nonzero(board == -1))
+    black_captures = 12 - int(white_in_hand[0]) - int(np.count_nonzero(board == 1))
+    game = Yote()
+    game.load_position(board, int(turns[0]), int(white_in_hand[0]), int(black_in_hand[0]), white_captures, black_captures)
+    return game
+
+
+class PositionStore:
+    # the number of keys between two entries of the sparse index kept in memory
+    INDEX_STRIDE = 4096
+    # the number of stored rows merged at once by flush
+    MERGE_CHUNK = 1 << 20
+
+    def __init__(self, path: str):
+        self.__path = path
+        os.makedirs(path, exist_ok=True)
+        self.__generation = 0
+        manifest = os.path.join(path, 'manifest.json')
+        if os.path.exists(manifest):
+            with open(manifest) as file:
+                self.__generation = json.load(file)['generation']
+        self.__open()
+        # the positions added since the last flush
+        self.__buffer_keys = []
+        self.__buffer_evaluations = []
+        self.__buffer_outcomes = []
+
+
+    def __file(self, name: str, generation: int):
+        return os.path.join(self.__path, f"{name}.{generation}.npy")
+
+
+    def __open(self):
+        if self.__generation == 0:
+            self.__keys = np.empty(0, dtype=np.uint64)
+            self.__columns = {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+        else:
+            self.__keys = np.load(self.__file('keys', self.__generation), mmap_mode='r')
+            self.__columns = {name: np.load(self.__file(name, self.__generation), mmap_mode='r') for name in COLUMNS}
+        # every INDEX_STRIDE-th key, to find the block of a key without a binary search over the whole file
+        self.__index = np.array(self.__keys[::self.INDEX_STRIDE])
+
+
+    def __len__(self):
+        return len(self.__keys)
+
+
+    @property
+    def keys(self):
+        return self.__keys
+
+
+    def column(self, name: str):
+        """
+        Returns a value column as a read-only memory-mapped array, aligned with keys
+        """
+        return self.__columns[name]
+
+
+    def find(self, keys: np.ndarray):
+        """
+        Returns the rows of a batch of keys, -1 for the keys that are not stored
+        """
+        keys = np.asarray(keys, dtype=np.uint64)
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        if len(self.__keys) == 0:
+            return rows
+        blocks = np.maximum(np.searchsorted(self.__index, keys, side='right') - 1, 0)
+        for block in np.unique(blocks):
+            selected = np.nonzero(blocks == block)[0]
+            start = block * self.INDEX_STRIDE
+            segment = self.__keys[start:start + self.INDEX_STRIDE]
+            positions = np.minimum(np.searchsorted(segment, keys[selected]), len(segment) - 1)
+            found = segment[positions] == keys[selected]
+            rows[selected[found]] = start + positions[found]
+        return rows
+
+
+    def lookup(self, game: Yote):
+        """
+        Returns the values stored for the position of a game, or None if it is not stored
+        """
+        row = self.find([encode(game)])[0]
+        if row < 0:
+            return None
+        return {name: column[row].item() for name, column in self.__columns.items()}
+
+
+    def add(self, game: Yote, evaluation: float = None, outcome: int = None):
+        """
+        Buffers a position with an optional evaluation and outcome (1: the player to move won, 0: draw, -1: lost)
+        """
+        self.__buffer_keys.append(encode(game))
+        self.__buffer_evaluations.append(np.nan if evaluation is None else evaluation)
+        self.__buffer_outcomes.append(2 if outcome is None else outcome)
+
+
+    def add_batch(self, keys: np.ndarray, evaluations: np.ndarray = None, outcomes: np.ndarray = None):
+        """
+        Buffers a batch of encoded positions, like add
+        """
+        keys = np.asarray(keys, dtype=np.uint64)
+        self.__buffer_keys.extend(keys.tolist())
+        self.__buffer_evaluations.extend([np.nan] * len(keys) if evaluations is None else np.asarray(evaluations, dtype=np.float64).tolist())
+        self.__buffer_outcomes.extend([2] * len(keys) if outcomes is None else np.asarray(outcomes).tolist())
+
+
+    def __aggregate_buffer(self):
+        """
+        Deduplicates the buffered positions and returns their sorted keys with their values
+        """
+        keys, inverse = np.unique(np.array(self.__buffer_keys, dtype=np.uint64), return_inverse=True)
+        evaluations = np.array(self.__buffer_evaluations, dtype=np.float64)
+        outcomes = np.array(self.__buffer_outcomes)
+        values = {
+            'visits': np.bincount(inverse, minlength=len(keys)),
+            'wins': np.bincount(inverse, weights=outcomes == 1, minlength=len(keys)),
+            'draws': np.bincount(inverse, weights=outcomes == 0, minlength=len(keys)),
+            'losses': np.bincount(inverse, weights=outcomes == -1, minlength=len(keys)),
+        }
+        values = {name: value.astype(COLUMNS[name]) for name, value in values.items()}
+        # the last evaluation given for a position is kept
+        values['evaluation'] = np.full(len(keys), np.nan, dtype=COLUMNS['evaluation'])
+        given = np.nonzero(~np.isnan(evaluations))[0][::-1]
+        rows, last = np.unique(inverse[given], return_index=True)
+        values['evaluation'][rows] = evaluations[given[last]]
+        return keys, values
+
+
+    def flush(self):
+        """
+        Merges the buffered positions into the files of a new generation of the store
+        """
+        if len(self.__buffer_keys) == 0:
+            return
+        keys, values = self.__aggregate_buffer()
+
+        # the buffered positions already stored only update their values, the others are inserted
+        rows = self.find(keys)
+        stored = rows >= 0
+        new_keys = keys[~stored]
+        new_values = {name: value[~stored] for name, value in values.items()}
+        insertions = np.searchsorted(self.__keys, new_keys)
+
+        generation = self.__generation + 1
+        total = len(self.__keys) + len(new_keys)
+        out_keys = np.lib.format.open_memmap(self.__file('keys', generation), mode='w+', dtype=np.uint64, shape=(total,))
+        out_columns = {name: np.lib.format.open_memmap(self.__file(name, generation), mode='w+', dtype=dtype, shape=(total,)) for name, dtype in COLUMNS.items()}
+
+        # the stored rows are copied by chunks, with the new positions inserted at their place in each chunk
+        written = 0
+        for start in range(0, max(len(self.__keys), 1), self.MERGE_CHUNK):
+            end = min(start + self.MERGE_CHUNK, len(self.__keys))
+            last_chunk = end == len(self.__keys)
+            first = np.searchsorted(insertions, start, side='left')
+            stop = len(insertions) if last_chunk else np.searchsorted(insertions, end, side='left')
+            offsets = insertions[first:stop] - start
+            chunk_keys = np.insert(np.asarray(self.__keys[start:end]), offsets, new_keys[first:stop])
+            out_keys[written:written + len(chunk_keys)] = chunk_keys
+            for name in COLUMNS:
+                out_columns[name][written:written + len(chunk_keys)] = np.insert(np.asarray(self.__columns[name][start:end]), offsets, new_values[name][first:stop])
+            written += len(chunk_keys)
+
+        # the values of the positions that were already stored are merged in place
+        out_rows = np.searchsorted(out_keys, keys[stored])
+        for name in ('visits', 'wins', 'draws', 'losses'):
+            out_columns[name][out_rows] += values[name][stored]
+        evaluations = values['evaluation'][stored]
+        given = ~np.isnan(evaluations)
+        out_columns['evaluation'][out_rows[given]] = evaluations[given]
+
+        out_keys.flush()
+        for column in out_columns.values():
+            column.flush()
+        del out_keys, out_columns
+
+        # the manifest is replaced atomically, so that readers always see a complete generation
+        manifest = os.path.join(self.__path, 'manifest.json')
+        with open(manifest + '.tmp', 'w') as file:
+            json.dump({'generation': generation, 'positions': total}, file)
+        os.replace(manifest + '.tmp', manifest)
+
+        previous = self.__generation
+        self.__generation = generation
+        self.__buffer_keys = []
+        self.__buffer_evaluations = []
+        self.__buffer_outcomes = []
+        self.__open()
+        if previous > 0:
+            for name in ['keys'] + list(COLUMNS):
+                os.remove(self.__file(name, previous))
+
+
+    def close(self):
+        self.flush()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -218,8 +218,11 @@ class YoteGUI:
         
         # Game over message
         if self.game_over:
-            winner_name = "White (You)" if self.winner == 1 else "Black (AI)"
-            game_over_text = self.font.render(f"{winner_name} wins!", True, RED)
+            if self.winner is None:
+                game_over_text = self.font.render("Draw!", True, RED)
+            else:
+                winner_name = "White (You)" if self.winner == 1 else "Black (AI)"
+                game_over_text = self.font.render(f"{winner_name} wins!", True, RED)
             self.screen.blit(game_over_text, (info_x, info_y + 360))
     
     def handle_click(self, pos):